@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Compact departures index over the post-processed GTFS feed.
+- stop -> departures sorted by time
+- trip -> range of its stop_times
+- service -> sorted active dates (calendar.txt and calendar_dates.txt resolved)
+
+The index is a single file of fixed-width little-endian uint32 arrays plus an
+interned string table. Opening it only maps the file and reads the section
+table, so queries can run right away without parsing the feed.
+
+Usage:
+    departures_index.py build [FEED_DIR] [OUTPUT]
+    departures_index.py departures INDEX STOP_ID DATE [FROM] [TO]
+    departures_index.py trip INDEX TRIP_ID
+    departures_index.py service INDEX SERVICE_ID
+"""
+
+import argparse
+import csv
+import datetime as dt
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+FEED_DIR = Path("feed")
+INDEX_PATH = Path("departures.idx")
+ENCODING = "utf-8-sig"
+DATE_FMT = "%Y%m%d"
+
+MAGIC = b"GTFSDIX1"
+HEADER = struct.Struct("<8sI")
+SECTION = struct.Struct("<16sII")
+NO_TIME = 0xFFFFFFFF
+SECONDS_PER_DAY = 86400
+
+# Sections in file order; "strings" is raw UTF-8, the rest are uint32 arrays.
+# *_start arrays hold n + 1 offsets into the arrays that follow them.
+SECTIONS = (
+    "strings",    # concatenated UTF-8 of every interned string
+    "str_ends",   # end offset of each string in "strings"
+    "stop_key",   # string id of each stop_id, sorted by stop_id
+    "dep_start",  # per stop: first departure
+    "dep_time",   # departure time in seconds, sorted within each stop
+    "dep_st",     # stop_time row of each departure
+    "trip_key",   # string id of each trip_id, sorted by trip_id
+    "trip_svc",   # service of each trip
+    "trip_rte",   # string id of route_short_name (or route_id)
+    "trip_hs",    # string id of trip_headsign
+    "st_start",   # per trip: first stop_time row
+    "st_stop",    # stop of each stop_time row, in stop_sequence order
+    "st_seq",     # stop_sequence
+    "st_arr",     # arrival time in seconds, NO_TIME if empty
+    "st_dep",     # departure time in seconds, NO_TIME if empty
+    "svc_key",    # string id of each service_id, sorted by service_id
+    "date_start", # per service: first active date
+    "dates",      # active dates as YYYYMMDD integers, sorted within each service
+)
+
+
+class Departure(NamedTuple):
+    time: str
+    stop_id: str
+    trip_id: str
+    route: str
+    headsign: str
+    stop_sequence: int
+
+
+class StopTime(NamedTuple):
+    stop_id: str
+    stop_sequence: int
+    arrival_time: str
+    departure_time: str
+
+
+def parse_gtfs_time(time_str: str) -> int:
+    """Convert GTFS time (HH:MM:SS) to seconds since midnight, NO_TIME if empty."""
+    if not time_str or not time_str.strip():
+        return NO_TIME
+    hours, minutes, seconds = time_str.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def parse_query_date(value: str) -> dt.date:
+    """Parse a YYYYMMDD query date, raising ValueError if malformed."""
+    try:
+        return dt.datetime.strptime(value.strip(), DATE_FMT).date()
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}, expected YYYYMMDD.") from None
+
+
+def parse_query_time(value: str) -> int:
+    """Parse an HH:MM:SS query time, raising ValueError if empty or malformed."""
+    try:
+        seconds = parse_gtfs_time(value)
+    except ValueError:
+        seconds = NO_TIME
+    if seconds == NO_TIME:
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM:SS.")
+    return seconds
+
+
+def format_gtfs_time(seconds: int) -> str:
+    """Convert seconds since midnight to GTFS time (HH:MM:SS)."""
+    if seconds == NO_TIME:
+        return ""
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def load_csv(path: Path) -> list[dict[str, str]]:
+    if not path.exists():
+        return []
+    with open(path, encoding=ENCODING, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def active_dates(feed_dir: Path) -> dict[str, set[int]]:
+    """Resolve calendar.txt and calendar_dates.txt into active dates per service."""
+    weekdays = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+    dates: dict[str, set[int]] = {}
+
+    for row in load_csv(feed_dir / "calendar.txt"):
+        service_id = (row.get("service_id") or "").strip()
+        try:
+            day = dt.datetime.strptime(row["start_date"].strip(), DATE_FMT).date()
+            end = dt.datetime.strptime(row["end_date"].strip(), DATE_FMT).date()
+        except (KeyError, ValueError):
+            continue
+        dates.setdefault(service_id, set())
+        while day <= end:
+            if (row.get(weekdays[day.weekday()]) or "").strip() == "1":
+                dates[service_id].add(int(day.strftime(DATE_FMT)))
+            day += dt.timedelta(days=1)
+
+    for row in load_csv(feed_dir / "calendar_dates.txt"):
+        service_id = (row.get("service_id") or "").strip()
+        try:
+            date = int(row["date"].strip())
+        except (KeyError, ValueError):
+            continue
+        exception_type = (row.get("exception_type") or "").strip()
+        if exception_type == "1":
+            dates.setdefault(service_id, set()).add(date)
+        elif exception_type == "2":
+            dates.setdefault(service_id, set()).discard(date)
+
+    return dates
+
+
+class _Strings:
+    """Interned string table."""
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.blob = bytearray()
+        self.ends = array("I")
+
+    def intern(self, value: str) -> int:
+        if value not in self.ids:
+            self.ids[value] = len(self.ends)
+            self.blob += value.encode("utf-8")
+            self.ends.append(len(self.blob))
+        return self.ids[value]
+
+
+def build(feed_dir: Path, output_path: Path):
+    """
+    Compile the feed in feed_dir into a departures index at output_path.
+    Raises FileNotFoundError if trips.txt or stop_times.txt is missing and
+    ValueError if the feed yields no departures.
+    """
+    for name in ("trips.txt", "stop_times.txt"):
+        if not (feed_dir / name).exists():
+            raise FileNotFoundError(f"Missing {feed_dir / name}.")
+
+    strings = _Strings()
+    sections: dict[str, array] = {name: array("I") for name in SECTIONS[1:]}
+
+    service_dates = active_dates(feed_dir)
+    trip_rows = load_csv(feed_dir / "trips.txt")
+    for row in trip_rows:
+        for column in ("trip_id", "route_id", "service_id"):
+            row[column] = (row.get(column) or "").strip()
+        service_dates.setdefault(row["service_id"], set())
+
+    # Services
+    service_ids = sorted(service_dates)
+    service_index = {service_id: i for i, service_id in enumerate(service_ids)}
+    sections["date_start"].append(0)
+    for service_id in service_ids:
+        sections["svc_key"].append(strings.intern(service_id))
+        sections["dates"].extend(sorted(service_dates[service_id]))
+        sections["date_start"].append(len(sections["dates"]))
+
+    # Stops
+    stop_ids = sorted({row["stop_id"].strip() for row in load_csv(feed_dir / "stops.txt")})
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+    for stop_id in stop_ids:
+        sections["stop_key"].append(strings.intern(stop_id))
+
+    # Trips
+    routes: dict[str, str] = {}
+    for row in load_csv(feed_dir / "routes.txt"):
+        route_id = row["route_id"].strip()
+        routes[route_id] = (row.get("route_short_name") or "").strip() or route_id
+    trip_rows.sort(key=lambda row: row["trip_id"])
+    trip_index = {row["trip_id"]: i for i, row in enumerate(trip_rows)}
+    for row in trip_rows:
+        sections["trip_key"].append(strings.intern(row["trip_id"]))
+        sections["trip_svc"].append(service_index[row["service_id"]])
+        sections["trip_rte"].append(strings.intern(routes.get(row["route_id"], row["route_id"])))
+        sections["trip_hs"].append(strings.intern((row.get("trip_headsign") or "").strip()))
+
+    # Stop times, grouped by trip in stop_sequence order
+    by_trip: list[list[tuple[int, int, int, int]]] = [[] for _ in trip_rows]
+    skipped = {"unknown trip_id": 0, "unknown stop_id": 0, "malformed stop_sequence or time": 0}
+    with open(feed_dir / "stop_times.txt", encoding=ENCODING, newline="") as f:
+        for row in csv.DictReader(f):
+            trip = trip_index.get((row.get("trip_id") or "").strip())
+            stop = stop_index.get((row.get("stop_id") or "").strip())
+            if trip is None:
+                skipped["unknown trip_id"] += 1
+                continue
+            if stop is None:
+                skipped["unknown stop_id"] += 1
+                continue
+            try:
+                stop_time = (
+                    int(row.get("stop_sequence") or ""),
+                    stop,
+                    parse_gtfs_time(row.get("arrival_time", "")),
+                    parse_gtfs_time(row.get("departure_time", "")),
+                )
+            except ValueError:
+                skipped["malformed stop_sequence or time"] += 1
+                continue
+            by_trip[trip].append(stop_time)
+
+    departures: list[list[tuple[int, int]]] = [[] for _ in stop_ids]
+    sections["st_start"].append(0)
+    for stop_times in by_trip:
+        stop_times.sort()
+        for position, (seq, stop, arrival, departure) in enumerate(stop_times):
+            row_index = len(sections["st_stop"])
+            sections["st_stop"].append(stop)
+            sections["st_seq"].append(seq)
+            sections["st_arr"].append(arrival)
+            sections["st_dep"].append(departure)
+            # The last stop of a trip is an arrival only
+            if departure != NO_TIME and position < len(stop_times) - 1:
+                departures[stop].append((departure, row_index))
+        sections["st_start"].append(len(sections["st_stop"]))
+    by_trip.clear()
+
+    sections["dep_start"].append(0)
+    for stop_departures in departures:
+        stop_departures.sort()
+        for departure, row_index in stop_departures:
+            sections["dep_time"].append(departure)
+            sections["dep_st"].append(row_index)
+        sections["dep_start"].append(len(sections["dep_time"]))
+
+    if not sections["dep_time"]:
+        raise ValueError(f"No departures found in {feed_dir}, not writing an empty index.")
+
+    sections["str_ends"] = strings.ends
+    if sys.byteorder != "little":
+        for values in sections.values():
+            values.byteswap()
+
+    payloads = [bytes(strings.blob)] + [sections[name].tobytes() for name in SECTIONS[1:]]
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    table = []
+    for name, payload in zip(SECTIONS, payloads):
+        table.append(SECTION.pack(name.encode("ascii"), offset, len(payload)))
+        # Keep every array 4-byte aligned for memoryview.cast
+        offset += len(payload) + (-len(payload) % 4)
+
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(SECTIONS)))
+        f.writelines(table)
+        for payload in payloads:
+            f.write(payload)
+            f.write(b"\0" * (-len(payload) % 4))
+
+    print(f"Built {output_path}:")
+    print(f"  - {len(stop_ids)} stops, {len(sections['dep_time'])} departures")
+    print(f"  - {len(trip_rows)} trips, {len(sections['st_stop'])} stop times")
+    print(f"  - {len(service_ids)} services, {len(sections['dates'])} active dates")
+    for reason, count in skipped.items():
+        print(f"  - Skipped {count} stop times with {reason}")
+
+
+class DeparturesIndex:
+    """Read-only, memory-mapped view of a departures index."""
+
+    def __init__(self, path: Path):
+        if sys.byteorder != "little":
+            raise ValueError("Departures index can only be read on little-endian hosts.")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, count = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a departures index.")
+        self._sections: dict[str, memoryview] = {}
+        for i in range(count):
+            name, offset, size = SECTION.unpack_from(self._buffer, HEADER.size + i * SECTION.size)
+            view = self._buffer[offset:offset + size]
+            name = name.rstrip(b"\0").decode("ascii")
+            self._sections[name] = view if name == "strings" else view.cast("I")
+
+    def close(self):
+        self._sections.clear()
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "DeparturesIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _string(self, string_id: int) -> str:
+        ends = self._sections["str_ends"]
+        start = ends[string_id - 1] if string_id else 0
+        return bytes(self._sections["strings"][start:ends[string_id]]).decode("utf-8")
+
+    def _find(self, keys: str, value: str) -> Optional[int]:
+        """Binary search a sorted *_key section for value."""
+        view = self._sections[keys]
+        lo, hi = 0, len(view)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(view[mid]) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(view) and self._string(view[lo]) == value:
+            return lo
+        return None
+
+    def _service_active(self, service: int, date: int) -> bool:
+        start = self._sections["date_start"][service]
+        end = self._sections["date_start"][service + 1]
+        dates = self._sections["dates"]
+        pos = bisect_left(dates, date, start, end)
+        return pos < end and dates[pos] == date
+
+    def _trip_of_row(self, row_index: int) -> int:
+        return bisect_right(self._sections["st_start"], row_index) - 1
+
+    def service_dates(self, service_id: str) -> list[str]:
+        """Active dates (YYYYMMDD) of a service."""
+        service = self._find("svc_key", service_id)
+        if service is None:
+            raise KeyError(service_id)
+        start = self._sections["date_start"][service]
+        end = self._sections["date_start"][service + 1]
+        return [str(date) for date in self._sections["dates"][start:end]]
+
+    def trip(self, trip_id: str) -> list[StopTime]:
+        """Stop times of a trip in stop_sequence order."""
+        trip = self._find("trip_key", trip_id)
+        if trip is None:
+            raise KeyError(trip_id)
+        s = self._sections
+        return [
+            StopTime(
+                self._string(s["stop_key"][s["st_stop"][row]]),
+                s["st_seq"][row],
+                format_gtfs_time(s["st_arr"][row]),
+                format_gtfs_time(s["st_dep"][row]),
+            )
+            for row in range(s["st_start"][trip], s["st_start"][trip + 1])
+        ]
+
+    def departures(
+        self, stop_id: str, date: str, start: str = "00:00:00", end: str = "23:59:59"
+    ) -> list[Departure]:
+        """
+        Departures from stop_id on date (YYYYMMDD) between start and end.
+        Includes trips of the previous service day running past midnight.
+        Raises ValueError for a malformed date or time.
+        """
+        day = parse_query_date(date)
+        start_seconds = parse_query_time(start)
+        end_seconds = parse_query_time(end)
+        stop = self._find("stop_key", stop_id)
+        if stop is None:
+            raise KeyError(stop_id)
+        s = self._sections
+        first = s["dep_start"][stop]
+        last = s["dep_start"][stop + 1]
+        times = s["dep_time"]
+
+        found: list[tuple[int, int]] = []
+        for service_day, shift in ((day - dt.timedelta(days=1), SECONDS_PER_DAY), (day, 0)):
+            service_date = int(service_day.strftime(DATE_FMT))
+            lo = bisect_left(times, start_seconds + shift, first, last)
+            hi = bisect_right(times, end_seconds + shift, first, last)
+            for dep in range(lo, hi):
+                row_index = s["dep_st"][dep]
+                trip = self._trip_of_row(row_index)
+                if self._service_active(s["trip_svc"][trip], service_date):
+                    found.append((times[dep] - shift, row_index))
+
+        found.sort()
+        result = []
+        for seconds, row_index in found:
+            trip = self._trip_of_row(row_index)
+            result.append(
+                Departure(
+                    format_gtfs_time(seconds),
+                    stop_id,
+                    self._string(s["trip_key"][trip]),
+                    self._string(s["trip_rte"][trip]),
+                    self._string(s["trip_hs"][trip]),
+                    s["st_seq"][row_index],
+                )
+            )
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="compile the feed into an index")
+    build_parser.add_argument("feed_dir", nargs="?", type=Path, default=FEED_DIR)
+    build_parser.add_argument("output", nargs="?", type=Path, default=INDEX_PATH)
+
+    departures_parser = commands.add_parser("departures", help="departures from a stop")
+    departures_parser.add_argument("index", type=Path)
+    departures_parser.add_argument("stop_id")
+    departures_parser.add_argument("date", help="YYYYMMDD")
+    departures_parser.add_argument("start", nargs="?", default="00:00:00")
+    departures_parser.add_argument("end", nargs="?", default="23:59:59")
+
+    trip_parser = commands.add_parser("trip", help="stop times of a trip")
+    trip_parser.add_argument("index", type=Path)
+    trip_parser.add_argument("trip_id")
+
+    service_parser = commands.add_parser("service", help="active dates of a service")
+    service_parser.add_argument("index", type=Path)
+    service_parser.add_argument("service_id")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        try:
+            build(args.feed_dir, args.output)
+        except (OSError, ValueError) as e:
+            parser.exit(1, f"{e}\n")
+        return
+
+    with DeparturesIndex(args.index) as index:
+        try:
+            if args.command == "departures":
+                fields = Departure._fields
+                rows = index.departures(args.stop_id, args.date, args.start, args.end)
+            elif args.command == "trip":
+                fields = StopTime._fields
+                rows = index.trip(args.trip_id)
+            else:
+                fields = ("date",)
+                rows = [(date,) for date in index.service_dates(args.service_id)]
+        except KeyError as e:
+            parser.exit(1, f"Not found: {e.args[0]}\n")
+        except ValueError as e:
+            parser.exit(2, f"{e}\n")
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(fields)
+    writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Measure shape distances in GTFS feed using a spatial index.
+- shapes.txt: shape_dist_traveled as cumulative haversine distance in meters
+- stop_times.txt: shape_dist_traveled by projecting stops onto trip shapes
+- stops.txt: report coincident or near-duplicate stops
+"""
+
+import csv
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from spatial_index import ShapeIndex, StopIndex
+
+FEED_DIR = Path("feed")
+DUPLICATE_STOP_RADIUS_M = 2.0
+DUPLICATE_STOP_EXAMPLES = 5
+
+
+def load_csv(path: Path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+        return list(reader.fieldnames or []), rows
+
+
+def save_csv(path: Path, header: list[str], rows: list[dict[str, str]]):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def report_duplicate_stops(stop_index: StopIndex):
+    """Print how many stops lie within DUPLICATE_STOP_RADIUS_M of each other."""
+    pairs = stop_index.duplicates(DUPLICATE_STOP_RADIUS_M)
+    print(f"Found {len(pairs)} near-duplicate stop pairs within {DUPLICATE_STOP_RADIUS_M} m")
+    for stop_id, other_id, distance in pairs[:DUPLICATE_STOP_EXAMPLES]:
+        print(f"  - e.g. {stop_id} and {other_id} ({distance:.2f} m apart)")
+
+
+def measure_shapes(shapes_filepath: Path, shape_index: ShapeIndex):
+    """Rewrite shape_dist_traveled in shapes.txt from the indexed polylines."""
+    header, rows = load_csv(shapes_filepath)
+    if 'shape_dist_traveled' not in header:
+        header.append('shape_dist_traveled')
+
+    distances: dict[str, dict[int, float]] = {}
+    for row in rows:
+        shape_id = (row.get('shape_id') or '').strip()
+        if shape_id not in shape_index.shapes:
+            # Keep whatever distances the shape already has
+            continue
+        if shape_id not in distances:
+            distances[shape_id] = shape_index.point_distances(shape_id)
+        try:
+            seq = int(row.get('shape_pt_sequence') or '')
+        except ValueError:
+            seq = None
+        # Points the index skipped (bad sequence or coordinates) get no distance
+        distance = distances[shape_id].get(seq)
+        row['shape_dist_traveled'] = '' if distance is None else str(distance)
+
+    save_csv(shapes_filepath, header, rows)
+    print(f"Measured {len(distances)} shapes in {shapes_filepath.name}")
+
+
+def measure_stop_times(
+    trips_filepath: Path,
+    stop_times_filepath: Path,
+    stop_index: StopIndex,
+    shape_index: ShapeIndex,
+):
+    """Rewrite shape_dist_traveled in stop_times.txt by projecting stops onto shapes."""
+    trip_shapes: dict[str, str] = {}
+    with open(trips_filepath, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            shape_id = (row.get('shape_id') or '').strip()
+            if shape_id:
+                trip_shapes[row['trip_id'].strip()] = shape_id
+
+    stops = {stop_id: (lat, lon) for stop_id, lat, lon in stop_index.stops}
+
+    header, rows = load_csv(stop_times_filepath)
+    if 'shape_dist_traveled' not in header:
+        header.append('shape_dist_traveled')
+
+    by_trip: dict[str, list[tuple[int, dict[str, str]]]] = defaultdict(list)
+    malformed = 0
+    for row in rows:
+        try:
+            seq = int(row.get('stop_sequence') or '')
+        except ValueError:
+            # Left as is; the rest of its trip is still measured
+            malformed += 1
+            continue
+        by_trip[(row.get('trip_id') or '').strip()].append((seq, row))
+
+    measured = 0
+    unmeasured = 0
+    for trip_id, trip_rows in by_trip.items():
+        trip_rows.sort(key=lambda r: r[0])
+        shape_id = trip_shapes.get(trip_id)
+        distances = None
+        if shape_id:
+            stop_ids = tuple(row['stop_id'].strip() for _, row in trip_rows)
+            distances = shape_index.measure(shape_id, stop_ids, stops)
+        if distances is None:
+            # Keep whatever distances the trip already has
+            unmeasured += 1
+            continue
+        for (_, row), distance in zip(trip_rows, distances):
+            row['shape_dist_traveled'] = str(distance)
+        measured += 1
+
+    save_csv(stop_times_filepath, header, rows)
+    print(f"Measured {stop_times_filepath.name}:")
+    print(f"  - Projected stops of {measured} trips onto their shapes")
+    print(f"  - Kept existing distances of {unmeasured} trips without a usable shape")
+    print(f"  - Kept {malformed} rows with a malformed stop_sequence unchanged")
+
+
+def main():
+    started = time.perf_counter()
+    stop_index = StopIndex.from_file(FEED_DIR / "stops.txt")
+    report_duplicate_stops(stop_index)
+
+    shapes_filepath = FEED_DIR / "shapes.txt"
+    if not shapes_filepath.exists():
+        print(f"Skipping {shapes_filepath.name} (not found)")
+        return
+
+    # Built once and shared by both passes
+    shape_index = ShapeIndex.from_file(shapes_filepath)
+    print(f"Indexed {len(stop_index.stops)} stops and {len(shape_index.shapes)} shapes")
+
+    measure_shapes(shapes_filepath, shape_index)
+    measure_stop_times(
+        FEED_DIR / "trips.txt", FEED_DIR / "stop_times.txt", stop_index, shape_index
+    )
+    print(f"Done in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
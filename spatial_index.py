@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Grid-based spatial index over GTFS stops and shapes.
+- StopIndex: radius queries and near-duplicate detection over stops.txt points
+- ShapeIndex: projection of stops onto shape polylines (shape_dist_traveled)
+
+Points are bucketed into fixed-size lat/lon cells, so a query only inspects
+the cells around the point instead of scanning every stop or every segment.
+Distances are haversine, in meters.
+"""
+
+import csv
+import math
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterable, Optional
+
+ENCODING = "utf-8-sig"
+EARTH_RADIUS_M = 6371008.8
+
+# ~110 m of latitude per cell; segments are registered in every cell their
+# bounding box touches, so long segments only cost a few extra entries.
+CELL_SIZE_DEG = 0.001
+# Search radii tried in turn when snapping a stop onto its shape; beyond the
+# last one every remaining segment of the shape is scanned.
+SNAP_SEARCH_RADII_M = (50.0, 500.0)
+# A pass of the shape this much farther than the closest one still wins if it
+# comes earlier, so stops on loops snap to the first pass instead of skipping
+# ahead. Passes are runs of adjacent segments near the stop. Kept well below
+# the 10-20 m between stops on opposite sides of a street, so a stop on the
+# return leg of an out-and-back route does not snap onto the outbound pass.
+SNAP_TOLERANCE_M = 5.0
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in meters."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat: float, lon: float) -> tuple[int, int]:
+    return math.floor(lat / CELL_SIZE_DEG), math.floor(lon / CELL_SIZE_DEG)
+
+
+def _cell_span(lat: float, radius_m: float) -> tuple[int, int]:
+    """Number of cells (lat, lon) needed to cover radius_m around lat."""
+    deg_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    deg_lon = deg_lat / cos_lat
+    return math.ceil(deg_lat / CELL_SIZE_DEG), math.ceil(deg_lon / CELL_SIZE_DEG)
+
+
+class StopIndex:
+    """Grid index over stop points."""
+
+    def __init__(self):
+        self.stops: list[tuple[str, float, float]] = []
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+
+    def add(self, stop_id: str, lat: float, lon: float):
+        """Register a stop."""
+        self.cells[_cell(lat, lon)].append(len(self.stops))
+        self.stops.append((stop_id, lat, lon))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict[str, str]]) -> "StopIndex":
+        """Build an index from stops.txt rows, skipping rows without coordinates."""
+        index = cls()
+        for row in rows:
+            stop_id = (row.get("stop_id") or "").strip()
+            try:
+                lat = float(row.get("stop_lat") or "")
+                lon = float(row.get("stop_lon") or "")
+            except ValueError:
+                continue
+            if stop_id:
+                index.add(stop_id, lat, lon)
+        return index
+
+    @classmethod
+    def from_file(cls, filepath: Path) -> "StopIndex":
+        """Build an index from a stops.txt file."""
+        with open(filepath, encoding=ENCODING, newline="") as f:
+            return cls.from_rows(csv.DictReader(f))
+
+    def _candidates(self, lat: float, lon: float, radius_m: float) -> Iterable[int]:
+        span_lat, span_lon = _cell_span(lat, radius_m)
+        cell_lat, cell_lon = _cell(lat, lon)
+        for i in range(cell_lat - span_lat, cell_lat + span_lat + 1):
+            for j in range(cell_lon - span_lon, cell_lon + span_lon + 1):
+                yield from self.cells.get((i, j), ())
+
+    def near(self, lat: float, lon: float, radius_m: float) -> list[tuple[str, float]]:
+        """Return (stop_id, distance) of stops within radius_m, nearest first."""
+        found = []
+        for idx in self._candidates(lat, lon, radius_m):
+            stop_id, stop_lat, stop_lon = self.stops[idx]
+            distance = haversine(lat, lon, stop_lat, stop_lon)
+            if distance <= radius_m:
+                found.append((stop_id, distance))
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def duplicates(self, radius_m: float) -> list[tuple[str, str, float]]:
+        """Return (stop_id, other_stop_id, distance) for distinct stops within radius_m."""
+        pairs = []
+        for idx, (stop_id, lat, lon) in enumerate(self.stops):
+            for other in self._candidates(lat, lon, radius_m):
+                if other <= idx:
+                    continue
+                other_id, other_lat, other_lon = self.stops[other]
+                if other_id == stop_id:
+                    continue
+                distance = haversine(lat, lon, other_lat, other_lon)
+                if distance <= radius_m:
+                    pairs.append((stop_id, other_id, distance))
+        return pairs
+
+
+class _Shape:
+    """Single shape polyline with cumulative distances and a segment grid."""
+
+    def __init__(self, points: list[tuple[float, float]]):
+        self.points = points
+        self.cumulative: list[float] = [0.0]
+        for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+            self.cumulative.append(self.cumulative[-1] + haversine(lat1, lon1, lat2, lon2))
+
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        point_cells = [_cell(lat, lon) for lat, lon in points]
+        for seg, ((lat_a, lon_a), (lat_b, lon_b)) in enumerate(zip(point_cells, point_cells[1:])):
+            if lat_a == lat_b and lon_a == lon_b:
+                self.cells[(lat_a, lon_a)].append(seg)
+                continue
+            lat_lo, lat_hi = min(lat_a, lat_b), max(lat_a, lat_b)
+            lon_lo, lon_hi = min(lon_a, lon_b), max(lon_a, lon_b)
+            for i in range(lat_lo, lat_hi + 1):
+                for j in range(lon_lo, lon_hi + 1):
+                    self.cells[(i, j)].append(seg)
+
+    def _project_segment(self, seg: int, lat: float, lon: float) -> tuple[float, float]:
+        """Return (offset from shape, distance along shape) for a point on segment seg."""
+        lat1, lon1 = self.points[seg]
+        lat2, lon2 = self.points[seg + 1]
+        # Local equirectangular plane around the segment start
+        cos_lat = math.cos(math.radians(lat1))
+        bx = (lon2 - lon1) * cos_lat
+        by = lat2 - lat1
+        px = (lon - lon1) * cos_lat
+        py = lat - lat1
+        seg_len2 = bx * bx + by * by
+        t = 0.0 if seg_len2 == 0 else max(0.0, min(1.0, (px * bx + py * by) / seg_len2))
+        proj_lat = lat1 + t * (lat2 - lat1)
+        proj_lon = lon1 + t * (lon2 - lon1)
+        offset = haversine(lat, lon, proj_lat, proj_lon)
+        along = self.cumulative[seg] + t * (self.cumulative[seg + 1] - self.cumulative[seg])
+        return offset, along
+
+    def _candidate_segments(self, lat: float, lon: float, radius_m: float) -> set[int]:
+        span_lat, span_lon = _cell_span(lat, radius_m)
+        cell_lat, cell_lon = _cell(lat, lon)
+        segments: set[int] = set()
+        for i in range(cell_lat - span_lat, cell_lat + span_lat + 1):
+            for j in range(cell_lon - span_lon, cell_lon + span_lon + 1):
+                segments.update(self.cells.get((i, j), ()))
+        return segments
+
+    def project(self, lat: float, lon: float, min_seg: int) -> tuple[int, float]:
+        """
+        Project a point onto the shape, not before segment min_seg.
+        Returns (segment, distance along shape).
+        """
+        if len(self.points) < 2:
+            return 0, 0.0
+
+        last_seg = len(self.points) - 2
+        for radius_m in SNAP_SEARCH_RADII_M:
+            # Widen by the tolerance so earlier segments near the closest one are seen
+            candidates = [
+                seg
+                for seg in self._candidate_segments(lat, lon, radius_m + SNAP_TOLERANCE_M)
+                if seg >= min_seg
+            ]
+            projected = self._project_candidates(candidates, lat, lon)
+            if projected and min(offset for _, offset, _ in projected) <= radius_m:
+                break
+        else:
+            projected = self._project_candidates(range(min_seg, last_seg + 1), lat, lon)
+
+        if not projected:
+            return min_seg, self.cumulative[min_seg]
+        closest = min(offset for _, offset, _ in projected)
+        near = [item for item in projected if item[1] <= closest + SNAP_TOLERANCE_M]
+
+        # Split the near segments into separate passes of the shape by the
+        # point; within the first pass take its nearest segment. Projections
+        # of one pass stay within twice the search band of each other.
+        pass_gap = 2 * (closest + SNAP_TOLERANCE_M)
+        first_pass = [near[0]]
+        for item, previous in zip(near[1:], near):
+            seg, _, along = item
+            if seg != previous[0] + 1 or along - previous[2] > pass_gap:
+                break
+            first_pass.append(item)
+        seg, _, along = min(first_pass, key=lambda item: item[1])
+        return seg, along
+
+    def _project_candidates(
+        self, candidates: Iterable[int], lat: float, lon: float
+    ) -> list[tuple[int, float, float]]:
+        return [(seg, *self._project_segment(seg, lat, lon)) for seg in sorted(candidates)]
+
+
+class ShapeIndex:
+    """Per-shape segment grids for projecting stops onto shapes."""
+
+    def __init__(
+        self,
+        shapes: dict[str, list[tuple[float, float]]],
+        sequences: Optional[dict[str, list[int]]] = None,
+    ):
+        self.shapes: dict[str, _Shape] = {
+            shape_id: _Shape(points) for shape_id, points in shapes.items()
+        }
+        # shape_pt_sequence of every indexed point, when built from shapes.txt
+        self.sequences: dict[str, list[int]] = sequences or {}
+        self._cache: dict[tuple[str, tuple[str, ...]], list[float]] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict[str, str]]) -> "ShapeIndex":
+        """Build an index from shapes.txt rows."""
+        points: dict[str, list[tuple[int, float, float]]] = defaultdict(list)
+        for row in rows:
+            shape_id = (row.get("shape_id") or "").strip()
+            try:
+                seq = int(row.get("shape_pt_sequence") or "")
+                lat = float(row.get("shape_pt_lat") or "")
+                lon = float(row.get("shape_pt_lon") or "")
+            except ValueError:
+                continue
+            if shape_id:
+                points[shape_id].append((seq, lat, lon))
+        for pts in points.values():
+            pts.sort()
+        return cls(
+            {shape_id: [(lat, lon) for _, lat, lon in pts] for shape_id, pts in points.items()},
+            {shape_id: [seq for seq, _, _ in pts] for shape_id, pts in points.items()},
+        )
+
+    @classmethod
+    def from_file(cls, filepath: Path) -> "ShapeIndex":
+        """Build an index from a shapes.txt file."""
+        with open(filepath, encoding=ENCODING, newline="") as f:
+            return cls.from_rows(csv.DictReader(f))
+
+    def cumulative(self, shape_id: str) -> list[float]:
+        """Distance traveled at every point of the shape, in meters."""
+        return self.shapes[shape_id].cumulative
+
+    def point_distances(self, shape_id: str) -> dict[int, float]:
+        """Distance traveled at each shape_pt_sequence of the shape, in meters."""
+        return dict(zip(self.sequences[shape_id], self.cumulative(shape_id)))
+
+    def measure(
+        self,
+        shape_id: str,
+        stop_ids: tuple[str, ...],
+        stops: dict[str, tuple[float, float]],
+    ) -> Optional[list[float]]:
+        """
+        Distance traveled along shape_id for each stop of a trip, in meters.
+        Results are cached per (shape, stop pattern), since most trips of a
+        route share both. Returns None for unknown shapes or stops.
+        """
+        key = (shape_id, stop_ids)
+        if key in self._cache:
+            return self._cache[key]
+
+        shape = self.shapes.get(shape_id)
+        if shape is None or any(stop_id not in stops for stop_id in stop_ids):
+            return None
+
+        distances: list[float] = []
+        seg = 0
+        previous = 0.0
+        for stop_id in stop_ids:
+            lat, lon = stops[stop_id]
+            seg, along = shape.project(lat, lon, seg)
+            # Keep distances non-decreasing even when a stop projects slightly behind
+            previous = max(previous, along)
+            distances.append(previous)
+
+        self._cache[key] = distances
+        return distances
@@ -0,0 +1,142 @@
+from pathlib import Path
+
+import pytest
+
+from departures_index import Departure, DeparturesIndex, StopTime, build
+
+FEED = {
+    "calendar.txt": (
+        "monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date,service_id\n"
+        "1,1,1,1,1,0,0,20261019,20261025,wk\n"
+    ),
+    "calendar_dates.txt": (
+        "service_id,exception_type,date\n"
+        "wk,2,20261021\n"
+        "wk,1,20261024\n"
+        "extra,1,20261025\n"
+    ),
+    "stops.txt": "stop_id,stop_name\ns1,One\ns2,Two\ns3,Three\n",
+    "routes.txt": "route_id,route_short_name\nr1,7\nr2,\n",
+    "trips.txt": (
+        "route_id,service_id,trip_id,trip_headsign\n"
+        "r1,wk,t1,Centrum\n"
+        "r1, wk ,night,Zajezdnia\n"
+        "r2,extra,t3,\n"
+    ),
+    "stop_times.txt": (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+        "t1,08:10:00,08:10:00,s2,2\n"
+        "t1,08:00:00,08:00:00,s1,1\n"
+        "t1,08:20:00,08:20:00,s3,3\n"
+        "night,24:10:00,24:10:00,s1,1\n"
+        "night,24:20:00,24:20:00,s2,2\n"
+        "t3,09:00:00,09:00:00,s2,1\n"
+        "t3,09:10:00,09:10:00,s3,2\n"
+    ),
+}
+
+
+def write_feed(feed_dir: Path, files: dict[str, str]) -> Path:
+    feed_dir.mkdir()
+    for name, text in files.items():
+        (feed_dir / name).write_text(text, encoding="utf-8")
+    return feed_dir
+
+
+@pytest.fixture
+def index(tmp_path):
+    feed_dir = write_feed(tmp_path / "feed", FEED)
+    build(feed_dir, tmp_path / "departures.idx")
+    with DeparturesIndex(tmp_path / "departures.idx") as index:
+        yield index
+
+
+def test_service_dates_apply_calendar_and_exceptions(index):
+    assert index.service_dates("wk") == [
+        "20261019", "20261020", "20261022", "20261023", "20261024",
+    ]
+    assert index.service_dates("extra") == ["20261025"]
+
+
+def test_departures_within_time_window(index):
+    assert index.departures("s1", "20261019") == [
+        Departure("08:00:00", "s1", "t1", "7", "Centrum", 1),
+    ]
+    assert index.departures("s2", "20261019", "08:05:00", "08:15:00") == [
+        Departure("08:10:00", "s2", "t1", "7", "Centrum", 2),
+    ]
+    assert index.departures("s2", "20261025") == [
+        Departure("09:00:00", "s2", "t3", "r2", "", 1),
+    ]
+
+
+def test_past_midnight_trip_shows_on_next_date(index):
+    assert index.departures("s1", "20261020", "00:00:00", "01:00:00") == [
+        Departure("00:10:00", "s1", "night", "7", "Zajezdnia", 1),
+    ]
+    # Service day 20261021 is removed, so nothing runs past midnight into the 22nd
+    assert index.departures("s1", "20261022", "00:00:00", "01:00:00") == []
+
+
+def test_last_stop_of_trip_is_not_a_departure(index):
+    assert index.departures("s3", "20261019") == []
+    assert index.departures("s3", "20261025") == []
+
+
+def test_trip_returns_stop_times_in_sequence_order(index):
+    assert index.trip("t1") == [
+        StopTime("s1", 1, "08:00:00", "08:00:00"),
+        StopTime("s2", 2, "08:10:00", "08:10:00"),
+        StopTime("s3", 3, "08:20:00", "08:20:00"),
+    ]
+    assert index.trip("night")[0] == StopTime("s1", 1, "24:10:00", "24:10:00")
+
+
+def test_unknown_ids_raise_key_error(index):
+    with pytest.raises(KeyError):
+        index.departures("nope", "20261019")
+    with pytest.raises(KeyError):
+        index.trip("nope")
+    with pytest.raises(KeyError):
+        index.service_dates("nope")
+
+
+@pytest.mark.parametrize(
+    "date, start, end",
+    [
+        ("2026-10-19", "00:00:00", "23:59:59"),
+        ("20261019", "4pm", "23:59:59"),
+        ("20261019", "00:00:00", ""),
+    ],
+)
+def test_malformed_query_raises_value_error(index, date, start, end):
+    with pytest.raises(ValueError):
+        index.departures("s1", date, start, end)
+
+
+def test_build_requires_trips_and_stop_times(tmp_path):
+    files = {name: text for name, text in FEED.items() if name != "trips.txt"}
+    feed_dir = write_feed(tmp_path / "feed", files)
+
+    with pytest.raises(FileNotFoundError):
+        build(feed_dir, tmp_path / "departures.idx")
+
+
+def test_build_reports_skipped_stop_times(tmp_path, capsys):
+    stop_times = FEED["stop_times.txt"] + "ghost,08:00:00,08:00:00,s1,1\nt1,08:30:00,08:30:00,zz,4\n"
+    feed_dir = write_feed(tmp_path / "feed", dict(FEED, **{"stop_times.txt": stop_times}))
+
+    build(feed_dir, tmp_path / "departures.idx")
+
+    output = capsys.readouterr().out
+    assert "Skipped 1 stop times with unknown trip_id" in output
+    assert "Skipped 1 stop times with unknown stop_id" in output
+
+
+def test_build_refuses_empty_index(tmp_path):
+    files = dict(FEED, **{"stops.txt": "stop_id,stop_name\nother,Other\n"})
+    feed_dir = write_feed(tmp_path / "feed", files)
+
+    with pytest.raises(ValueError):
+        build(feed_dir, tmp_path / "departures.idx")
+    assert not (tmp_path / "departures.idx").exists()
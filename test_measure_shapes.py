@@ -0,0 +1,79 @@
+import csv
+import importlib.util
+from pathlib import Path
+
+from spatial_index import ShapeIndex, StopIndex
+
+spec = importlib.util.spec_from_file_location(
+    "measure_shapes", Path(__file__).with_name("measure-shapes.py")
+)
+measure_shapes = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(measure_shapes)
+
+
+def write_csv(path: Path, text: str) -> Path:
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def read_csv(path: Path) -> list[dict[str, str]]:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+SHAPES = """shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence,shape_dist_traveled
+ s ,50.0,19.01,3,9
+ s ,50.0,19.0,1,9
+ s ,bad,19.002,2,9
+ s ,50.0,19.02,x,9
+other,bad,bad,1,7
+"""
+
+
+def test_measure_shapes_writes_distances_by_sequence(tmp_path):
+    shapes = write_csv(tmp_path / "shapes.txt", SHAPES)
+    shape_index = ShapeIndex.from_file(shapes)
+
+    measure_shapes.measure_shapes(shapes, shape_index)
+
+    rows = read_csv(shapes)
+    cumulative = shape_index.cumulative("s")
+    assert float(rows[0]["shape_dist_traveled"]) == cumulative[1]
+    assert float(rows[1]["shape_dist_traveled"]) == 0.0
+    # Points the index skipped get no distance
+    assert rows[2]["shape_dist_traveled"] == ""
+    assert rows[3]["shape_dist_traveled"] == ""
+    # Shapes the index has no points for are left unchanged
+    assert rows[4]["shape_dist_traveled"] == "7"
+
+
+def test_measure_stop_times_keeps_distances_of_unprojected_trips(tmp_path):
+    stop_index = StopIndex()
+    stop_index.add("a", 50.0, 19.0)
+    stop_index.add("b", 50.0, 19.01)
+    shape_index = ShapeIndex({"s": [(50.0, 19.0), (50.0, 19.01)]})
+    trips = write_csv(
+        tmp_path / "trips.txt",
+        "route_id,service_id,trip_id,shape_id\n"
+        "r,1,ok,s\n"
+        "r,1,unknown_stop,s\n"
+        "r,1,unknown_shape,nope\n",
+    )
+    stop_times = write_csv(
+        tmp_path / "stop_times.txt",
+        "trip_id,stop_id,stop_sequence,shape_dist_traveled\n"
+        "ok,b,2,5\n"
+        "ok,a,1,5\n"
+        "ok,a,bad,5\n"
+        "unknown_stop,a,1,1.5\n"
+        "unknown_stop,zz,2,2.5\n"
+        "unknown_shape,a,1,3.5\n"
+        "unknown_shape,b,2,4.5\n",
+    )
+
+    measure_shapes.measure_stop_times(trips, stop_times, stop_index, shape_index)
+
+    distances = [row["shape_dist_traveled"] for row in read_csv(stop_times)]
+    assert float(distances[0]) == shape_index.cumulative("s")[1]
+    assert float(distances[1]) == 0.0
+    assert distances[2:] == ["5", "1.5", "2.5", "3.5", "4.5"]
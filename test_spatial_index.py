@@ -0,0 +1,83 @@
+from spatial_index import ShapeIndex, StopIndex
+
+
+def stop_index(*stops):
+    index = StopIndex()
+    for stop in stops:
+        index.add(*stop)
+    return index
+
+
+def test_near_returns_stops_within_radius_nearest_first():
+    index = stop_index(
+        ("far", 50.0, 19.001),  # ~72 m east
+        ("close", 50.0, 19.0001),  # ~7 m east
+        ("here", 50.0, 19.0),
+    )
+
+    found = index.near(50.0, 19.0, 10.0)
+
+    assert [stop_id for stop_id, _ in found] == ["here", "close"]
+    assert found[0][1] == 0.0
+
+
+def test_duplicates_pairs_distinct_stops_within_radius():
+    index = stop_index(
+        ("a", 50.0, 19.0),
+        ("b", 50.0, 19.0),
+        ("c", 50.0, 19.00001),  # ~0.7 m from a and b
+        ("d", 50.001, 19.0),  # ~111 m away
+    )
+
+    pairs = index.duplicates(2.0)
+
+    assert sorted(pair[:2] for pair in pairs) == [("a", "b"), ("a", "c"), ("b", "c")]
+
+
+def test_duplicates_ignores_repeated_stop_id():
+    index = stop_index(("a", 50.0, 19.0), ("a", 50.0, 19.0))
+
+    assert index.duplicates(2.0) == []
+
+
+def test_stop_on_shape_projects_onto_itself():
+    points = [(50.0, 19.0 + i * 0.00014) for i in range(101)]
+    shape_index = ShapeIndex({"line": points})
+
+    distances = shape_index.measure("line", ("stop",), {"stop": points[50]})
+
+    assert abs(distances[0] - shape_index.cumulative("line")[50]) < 0.01
+
+
+def test_stop_on_loop_snaps_to_first_pass():
+    points = [(50.0, 19.0), (50.0, 19.01), (50.01, 19.01), (50.0, 19.0)]
+    shape_index = ShapeIndex({"loop": points})
+    stops = {"start": (50.0, 19.0), "corner": (50.005, 19.0101)}
+
+    distances = shape_index.measure("loop", ("start", "corner", "start"), stops)
+
+    cumulative = shape_index.cumulative("loop")
+    assert distances[0] == 0.0
+    assert cumulative[1] < distances[1] < cumulative[2]
+    assert abs(distances[2] - cumulative[3]) < 0.01
+
+
+def test_stop_on_return_side_snaps_to_return_pass():
+    # 1 km out along one carriageway, back along the other 11 m to the north
+    step = 0.0014
+    north = 0.0001
+    outbound = [(50.0, 19.0 + i * step) for i in range(11)]
+    inbound = [(50.0 + north, 19.0 + i * step) for i in range(10, -1, -1)]
+    shape_index = ShapeIndex({"out-and-back": outbound + inbound})
+    stops = {
+        "a": (50.0, 19.0 + 2 * step),
+        "b": (50.0, 19.0 + 8 * step),
+        "c": (50.0 + north, 19.0 + 8 * step),
+        "d": (50.0 + north, 19.0 + 2 * step),
+    }
+
+    distances = shape_index.measure("out-and-back", ("a", "b", "c", "d"), stops)
+
+    cumulative = shape_index.cumulative("out-and-back")
+    expected = [cumulative[2], cumulative[8], cumulative[13], cumulative[19]]
+    assert all(abs(got - want) < 0.01 for got, want in zip(distances, expected))